@@ -1,10 +1,13 @@
-import shortuuid
 import streamlit as st
 import pandas as pd
 import sqlite3
+import copy
 import datetime
-import random
+import io
+import queue
+import secrets
 import string
+import threading
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -22,18 +25,79 @@ EMPRESA = {
 COLOR_PRINCIPAL = HexColor("#2A2A2A")
 COLOR_SECUNDARIO = HexColor("#F5F5F5")
 
+# Alfabeto para la parte aleatoria de los códigos de descuento
+_ALFABETO_CODIGO = string.ascii_uppercase + string.digits
+
 # Configuración de la base de datos
+DB_PATH = "facturacion_capilar.db"
+LECTORES_DB = 4
+# DROP COLUMN y RETURNING requieren SQLite 3.35+ (Debian bullseye trae 3.34)
+SQLITE_3_35 = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Consultas frecuentes; el mismo texto SQL reutiliza la sentencia preparada
+# en la caché de cada conexión
+SQL_SELECT_PRODUCTOS = "SELECT id, nombre, precio FROM productos"
+SQL_SELECT_CLIENTES = "SELECT id, nombre, cedula, telefono, direccion, codigo_descuento FROM clientes"
+SQL_SELECT_CLIENTES_ACTIVOS = SQL_SELECT_CLIENTES + " WHERE activo = 1"
+SQL_VALIDAR_CODIGO = "SELECT 1 FROM clientes WHERE codigo_descuento = ? AND activo = 1 LIMIT 1"
+SQL_INSERT_VENTA = '''INSERT INTO ventas (fecha, total, descuento)
+                      VALUES (?, ?, ?)'''
+SQL_INSERT_VENTA_RETURNING = SQL_INSERT_VENTA + " RETURNING id"
+SQL_NUMERAR_VENTA = "UPDATE ventas SET numero_factura = ? WHERE id = ?"
+SQL_INSERT_DETALLE = '''INSERT INTO ventas_detalle (venta_id, producto_id, cantidad, precio_unitario, descuento_aplicado)
+                        VALUES (?, ?, ?, ?, ?)'''
+SQL_SELECT_VENTAS_FECHA = '''SELECT numero_factura AS "N° Factura", fecha AS "Fecha",
+                                    total AS "Total", descuento AS "Descuento",
+                                    COALESCE(productos, '') AS "Productos"
+                             FROM v_ventas_report
+                             WHERE fecha = ?'''
+SQL_RESUMEN_VENTAS_FECHA = '''SELECT COALESCE(SUM(total), 0), COALESCE(SUM(descuento), 0), COUNT(*)
+                              FROM ventas
+                              WHERE fecha = ?'''
+
+@st.cache_resource
+def _conexion_escritura():
+    # Conexión única y persistente para escrituras; los PRAGMAs se aplican una sola vez.
+    # La comparten todas las sesiones, así que va acompañada de su propio lock.
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    for pragma in ("journal_mode = WAL", "synchronous = NORMAL", "temp_store = MEMORY",
+                   "foreign_keys = ON", "cache_size = -64000"):
+        conn.execute(f"PRAGMA {pragma}")
+    return conn, threading.Lock()
+
 @contextmanager
-def database_connection():
-    conn = sqlite3.connect("facturacion_capilar.db", check_same_thread=False)
-    conn.execute("PRAGMA foreign_keys = ON")
+def write_conn():
+    # Una transacción a la vez: sin el lock, las sesiones concurrentes
+    # compartirían la misma transacción de la conexión
+    conn, lock = _conexion_escritura()
+    with lock, conn:
+        yield conn
+
+@st.cache_resource
+def _pool_lectura():
+    # Conexiones de solo lectura: en modo WAL leen en paralelo sin esperar al escritor
+    pool = queue.Queue()
+    for _ in range(LECTORES_DB):
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True,
+                               check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        for pragma in ("temp_store = MEMORY", "cache_size = -16000"):
+            conn.execute(f"PRAGMA {pragma}")
+        pool.put(conn)
+    return pool
+
+@contextmanager
+def read_conn():
+    pool = _pool_lectura()
+    conn = pool.get()
     try:
         yield conn
     finally:
-        conn.close()
+        pool.put(conn)
 
 def init_db():
-    with database_connection() as conn:
+    with write_conn() as conn:
         c = conn.cursor()
 
         # Tabla productos
@@ -43,16 +107,22 @@ def init_db():
             precio REAL CHECK(precio > 0)
         )''')
 
-        # Tabla ventas - Añadida columna producto
+        # Tabla ventas
         c.execute('''CREATE TABLE IF NOT EXISTS ventas (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             fecha TEXT,
             total REAL CHECK(total >= 0),
             numero_factura TEXT UNIQUE,
-            descuento REAL DEFAULT 0,
-            producto TEXT
+            descuento REAL DEFAULT 0
         )''')
 
+        # Migración: la columna producto se reemplaza por la vista v_ventas_report.
+        # En SQLite anteriores a 3.35 se deja; es nullable y ya no se escribe.
+        if SQLITE_3_35:
+            columnas_ventas = [columna[1] for columna in c.execute("PRAGMA table_info(ventas)")]
+            if 'producto' in columnas_ventas:
+                c.execute("ALTER TABLE ventas DROP COLUMN producto")
+
         # Tabla ventas_detalle
         c.execute('''CREATE TABLE IF NOT EXISTS ventas_detalle (
             venta_id INTEGER,
@@ -75,21 +145,54 @@ def init_db():
             activo BOOLEAN DEFAULT 1)
         ''')
 
-        conn.commit()
+        # Índices para reportes por fecha y borrados en cascada.
+        # clientes.codigo_descuento ya tiene índice por ser UNIQUE.
+        c.execute("CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas(fecha)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_detalle_venta ON ventas_detalle(venta_id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_detalle_producto ON ventas_detalle(producto_id)")
+
+        # Vista para reportes: nombres de productos de cada venta desde ventas_detalle.
+        # La subconsulta correlacionada permite que el filtro por fecha use idx_ventas_fecha.
+        c.execute('''CREATE VIEW IF NOT EXISTS v_ventas_report AS
+            SELECT v.numero_factura, v.fecha, v.total, v.descuento,
+                   (SELECT GROUP_CONCAT(p.nombre, ', ')
+                    FROM ventas_detalle d
+                    JOIN productos p ON p.id = d.producto_id
+                    WHERE d.venta_id = v.id) AS productos
+            FROM ventas v
+        ''')
+
+@st.cache_resource
+def _ensure_schema():
+    # El esquema se crea una sola vez por proceso, no en cada rerun
+    init_db()
+    return True
+
+# Listados cacheados entre reruns; se invalidan en cada escritura.
+# sqlite3.Row no se puede serializar, por eso se guardan como dicts.
+@st.cache_data(ttl=300)
+def _productos_cached():
+    with read_conn() as conn:
+        return [dict(fila) for fila in conn.execute(SQL_SELECT_PRODUCTOS)]
+
+@st.cache_data(ttl=300)
+def _clientes_cached(activos):
+    query = SQL_SELECT_CLIENTES_ACTIVOS if activos else SQL_SELECT_CLIENTES
+    with read_conn() as conn:
+        return [dict(fila) for fila in conn.execute(query)]
 
 class ProductoManager:
     @staticmethod
     def obtener_productos():
-        with database_connection() as conn:
-            return conn.execute("SELECT id, nombre, precio FROM productos").fetchall()
+        return _productos_cached()
 
     @staticmethod
     def agregar_producto(nombre, precio):
         try:
-            with database_connection() as conn:
+            with write_conn() as conn:
                 conn.execute("INSERT INTO productos (nombre, precio) VALUES (?, ?)", (nombre, precio))
-                conn.commit()
-                return True, "Producto agregado exitosamente"
+            _productos_cached.clear()
+            return True, "Producto agregado exitosamente"
         except sqlite3.IntegrityError:
             return False, "Error: El nombre del producto ya existe"
         except Exception as e:
@@ -98,21 +201,21 @@ class ProductoManager:
     @staticmethod
     def eliminar_producto(producto_id):
         try:
-            with database_connection() as conn:
+            with write_conn() as conn:
                 conn.execute("DELETE FROM productos WHERE id = ?", (producto_id,))
-                conn.commit()
-                return True, "Producto eliminado exitosamente"
+            _productos_cached.clear()
+            return True, "Producto eliminado exitosamente"
         except Exception as e:
             return False, f"No se puede eliminar: {str(e)}"
 
     @staticmethod
     def actualizar_producto(producto_id, nuevo_nombre, nuevo_precio):
         try:
-            with database_connection() as conn:
+            with write_conn() as conn:
                 conn.execute("UPDATE productos SET nombre = ?, precio = ? WHERE id = ?",
                              (nuevo_nombre, nuevo_precio, producto_id))
-                conn.commit()
-                return True, "Producto actualizado exitosamente"
+            _productos_cached.clear()
+            return True, "Producto actualizado exitosamente"
         except sqlite3.IntegrityError:
             return False, "Error: El nuevo nombre ya existe"
         except Exception as e:
@@ -122,210 +225,239 @@ class VentaManager:
     @staticmethod
     def registrar_venta(factura):
         try:
-            with database_connection() as conn:
+            with write_conn() as conn:
                 fecha = datetime.date.today().isoformat()
+                # ventas.total guarda el bruto; el descuento va en su propia columna
                 total = sum(item['subtotal'] for item in factura['items'])
                 descuento = factura['monto_descuento'] if factura['descuento'] else 0
-                numero_factura = f"FACT-{shortuuid.ShortUUID().random(length=10)}"
-                
-                # Obtener nombres de productos para la columna producto
-                productos_nombres = [item['nombre'] for item in factura['items']]
-                producto_str = ', '.join(productos_nombres)
-                if len(producto_str) > 255:  # Limitar longitud para evitar problemas de BD
-                    producto_str = producto_str[:252] + "..."
-
-                c = conn.execute('''INSERT INTO ventas (fecha, total, numero_factura, descuento, producto)
-                                  VALUES (?, ?, ?, ?, ?)''', (fecha, total, numero_factura, descuento, producto_str))
-                venta_id = c.lastrowid
-
-                for item in factura['items']:
-                    conn.execute('''INSERT INTO ventas_detalle (venta_id, producto_id, cantidad, precio_unitario, descuento_aplicado)
-                                  VALUES (?, ?, ?, ?, ?)''',
-                                  (venta_id, item['producto_id'], item['cantidad'], item['precio'], item.get('descuento_total', 0)))
-                conn.commit()
+
+                # El número de factura se deriva del id, único y creciente
+                if SQLITE_3_35:
+                    venta_id = conn.execute(SQL_INSERT_VENTA_RETURNING, (fecha, total, descuento)).fetchone()[0]
+                else:
+                    venta_id = conn.execute(SQL_INSERT_VENTA, (fecha, total, descuento)).lastrowid
+                numero_factura = f"FACT-{venta_id:08d}"
+                conn.execute(SQL_NUMERAR_VENTA, (numero_factura, venta_id))
+
+                detalle = [(venta_id, item['producto_id'], item['cantidad'], item['precio'], item.get('descuento_total', 0))
+                           for item in factura['items']]
+                conn.executemany(SQL_INSERT_DETALLE, detalle)
                 return True, numero_factura
         except Exception as e:
             return False, f"Error al registrar venta: {str(e)}"
 
     @staticmethod
     def obtener_ventas_por_fecha(fecha):
-        with database_connection() as conn:
-            query = '''SELECT numero_factura, fecha, total, descuento, producto
-                       FROM ventas
-                       WHERE fecha = ?'''
+        # DataFrame con los nombres de columna de la vista y tipos numéricos explícitos
+        with read_conn() as conn:
+            return pd.read_sql_query(SQL_SELECT_VENTAS_FECHA, conn, params=(fecha,),
+                                     dtype={'Total': 'float64', 'Descuento': 'float64'})
+
+    @staticmethod
+    def resumen_por_fecha(fecha):
+        with read_conn() as conn:
+            return conn.execute(SQL_RESUMEN_VENTAS_FECHA, (fecha,)).fetchone()
+
+    @staticmethod
+    def productos_por_fecha(fecha):
+        # Totales brutos, como ventas.total. LEFT JOIN: las líneas de productos
+        # eliminados (producto_id NULL) también cuentan, para que la suma cuadre
+        # con el total del día
+        query = '''SELECT COALESCE(p.nombre, '(eliminado)') AS producto,
+                          SUM(vd.cantidad),
+                          SUM(vd.cantidad * vd.precio_unitario)
+                   FROM ventas v
+                   JOIN ventas_detalle vd ON vd.venta_id = v.id
+                   LEFT JOIN productos p ON p.id = vd.producto_id
+                   WHERE v.fecha = ?
+                   GROUP BY producto
+                   ORDER BY 3 DESC'''
+        with read_conn() as conn:
             return conn.execute(query, (fecha,)).fetchall()
 
 class ClienteManager:
     @staticmethod
     def obtener_clientes(activos=True):
-        with database_connection() as conn:
-            query = "SELECT * FROM clientes WHERE activo = ?" if activos else "SELECT * FROM clientes"
-            params = (1,) if activos else ()
-            return conn.execute(query, params).fetchall()
+        return _clientes_cached(activos)
 
     @staticmethod
     def generar_codigo_descuento(nombre):
-        iniciales = ''.join([part[0] for part in nombre.split()[:2]]).upper()
-        random_part = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
+        # maxsplit=2: solo interesan las dos primeras palabras
+        iniciales = ''.join(part[0] for part in nombre.split(None, 2)[:2]).upper()
+        random_part = ''.join(secrets.choice(_ALFABETO_CODIGO) for _ in range(4))
         return f"{iniciales}-{random_part}"
 
     @staticmethod
     def agregar_cliente(nombre, cedula, telefono, direccion):
         try:
-            codigo = ClienteManager.generar_codigo_descuento(nombre)
-            with database_connection() as conn:
-                conn.execute('''INSERT INTO clientes 
-                              (nombre, cedula, telefono, direccion, codigo_descuento)
-                              VALUES (?, ?, ?, ?, ?)''',
-                              (nombre, cedula, telefono, direccion, codigo))
-                conn.commit()
-                return True, codigo
+            with write_conn() as conn:
+                # Reintenta con un código nuevo si choca con uno existente
+                for _ in range(5):
+                    codigo = ClienteManager.generar_codigo_descuento(nombre)
+                    try:
+                        conn.execute('''INSERT INTO clientes 
+                                      (nombre, cedula, telefono, direccion, codigo_descuento)
+                                      VALUES (?, ?, ?, ?, ?)''',
+                                      (nombre, cedula, telefono, direccion, codigo))
+                        break
+                    except sqlite3.IntegrityError as e:
+                        if "codigo_descuento" not in str(e):
+                            raise
+                else:
+                    return False, "Error: No se pudo generar un código único"
+            _clientes_cached.clear()
+            return True, codigo
         except sqlite3.IntegrityError as e:
-            return False, "Error: Cédula o código ya existen"
+            if "cedula" in str(e):
+                return False, "Error: Cédula ya existe"
+            return False, f"Error: {str(e)}"
         except Exception as e:
             return False, f"Error: {str(e)}"
 
     @staticmethod
     def actualizar_cliente(cliente_id, nombre, cedula, telefono, direccion):
         try:
-            with database_connection() as conn:
-                conn.execute('''UPDATE clientes SET
-                              nombre = ?, cedula = ?, telefono = ?, direccion = ?
-                              WHERE id = ?''',
-                              (nombre, cedula, telefono, direccion, cliente_id))
-                conn.commit()
-                return True, "Cliente actualizado"
-        except sqlite3.IntegrityError:
-            return False, "Error: Cédula ya existe"
+            with write_conn() as conn:
+                actual = conn.execute("SELECT nombre, cedula, telefono, direccion FROM clientes WHERE id = ?",
+                                      (cliente_id,)).fetchone()
+                if actual is None:
+                    return False, "Error: Cliente no encontrado"
+
+                # Solo se actualizan las columnas que cambiaron
+                nuevos = {'nombre': nombre, 'cedula': cedula, 'telefono': telefono, 'direccion': direccion}
+                cambios = {col: valor for (col, valor), anterior in zip(nuevos.items(), actual) if valor != anterior}
+                if not cambios:
+                    return True, "Sin cambios"
+
+                asignaciones = ", ".join(f"{col} = ?" for col in cambios)
+                conn.execute(f"UPDATE clientes SET {asignaciones} WHERE id = ?",
+                             (*cambios.values(), cliente_id))
+            _clientes_cached.clear()
+            return True, "Cliente actualizado"
+        except sqlite3.IntegrityError as e:
+            if "cedula" in str(e):
+                return False, "Error: Cédula ya existe"
+            return False, f"Error: {str(e)}"
         except Exception as e:
             return False, f"Error: {str(e)}"
 
     @staticmethod
     def eliminar_cliente(cliente_id):
         try:
-            with database_connection() as conn:
+            with write_conn() as conn:
                 conn.execute("UPDATE clientes SET activo = 0 WHERE id = ?", (cliente_id,))
-                conn.commit()
-                return True, "Cliente desactivado"
+            _clientes_cached.clear()
+            return True, "Cliente desactivado"
         except Exception as e:
             return False, f"Error: {str(e)}"
 
-def generar_pdf(factura_data, numero_factura, total):
-    pdf_output = f"factura_{numero_factura}.pdf"
-    doc = SimpleDocTemplate(pdf_output, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-
-    header_style = ParagraphStyle(
-        'Header',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=COLOR_PRINCIPAL,
-        alignment=TA_CENTER
-    )
+# Estilos de PDF compartidos; se construyen una sola vez al cargar el módulo
+_STYLES = getSampleStyleSheet()
+_HEADER_STYLE = ParagraphStyle(
+    'Header',
+    parent=_STYLES['Heading2'],
+    fontSize=14,
+    textColor=COLOR_PRINCIPAL,
+    alignment=TA_CENTER
+)
+# Encabezado fijo de la empresa, parseado una sola vez. Cada PDF usa copias
+# superficiales porque wrap() guarda el tamaño en el propio flowable.
+_STATIC_HEADER = [
+    Paragraph(EMPRESA["nombre"], _HEADER_STYLE),
+    Paragraph(EMPRESA["direccion"], _STYLES['Normal']),
+    Paragraph(f"Tel: {EMPRESA['telefono']}", _STYLES['Normal']),
+    Spacer(1, 12)
+]
+_FACTURA_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0,0), (-1,0), COLOR_PRINCIPAL),
+    ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
+    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0,0), (-1,0), 9),
+    ('BOTTOMPADDING', (0,0), (-1,0), 8),
+    ('BACKGROUND', (0,1), (-1,-1), COLOR_SECUNDARIO),
+    ('GRID', (0,0), (-1,-1), 1, COLOR_PRINCIPAL)
+])
+_REPORTE_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0,0), (-1,0), COLOR_PRINCIPAL),
+    ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
+    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0,0), (-1,0), 9),
+    ('BACKGROUND', (0,1), (-1,-1), COLOR_SECUNDARIO),
+    ('GRID', (0,0), (-1,-1), 1, COLOR_PRINCIPAL)
+])
+_RESUMEN_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0,0), (-1,0), COLOR_PRINCIPAL),
+    ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
+    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+    ('GRID', (0,0), (-1,-1), 1, COLOR_PRINCIPAL)
+])
 
-    elements.append(Paragraph(EMPRESA["nombre"], header_style))
-    elements.append(Paragraph(EMPRESA["direccion"], styles['Normal']))
-    elements.append(Paragraph(f"Tel: {EMPRESA['telefono']}", styles['Normal']))
-    elements.append(Spacer(1, 12))
+def generar_pdf(factura_data, numero_factura, total):
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = [copy.copy(flowable) for flowable in _STATIC_HEADER]
 
-    elements.append(Paragraph(f"Factura N°: {numero_factura}", styles['Heading3']))
-    elements.append(Paragraph(f"Fecha: {datetime.date.today().strftime('%d/%m/%Y')}", styles['Normal']))
+    elements.append(Paragraph(f"Factura N°: {numero_factura}", _STYLES['Heading3']))
+    elements.append(Paragraph(f"Fecha: {datetime.date.today().strftime('%d/%m/%Y')}", _STYLES['Normal']))
 
     if factura_data['descuento']:
         total_descuento = sum(item.get('descuento_total', 0) for item in factura_data['items'])
-        elements.append(Paragraph(f"Código descuento: {factura_data['codigo_usado']}", styles['Normal']))
-        elements.append(Paragraph(f"Descuento total aplicado: ${total_descuento:.2f}", styles['Normal']))
+        elements.append(Paragraph(f"Código descuento: {factura_data['codigo_usado']}", _STYLES['Normal']))
+        elements.append(Paragraph(f"Descuento total aplicado: ${total_descuento:.2f}", _STYLES['Normal']))
 
     elements.append(Spacer(1, 24))
 
-    table_data = [["Producto", "Cantidad", "P. Unitario", "Descuento", "Total"]]
-    for item in factura_data['items']:
-        descuento = item.get('descuento_total', 0)
-        table_data.append([
-            item['nombre'][:35],
-            str(item['cantidad']),
-            f"${item['precio']:.2f}",
-            f"-${descuento:.2f}",
-            f"${item['subtotal']:.2f}"
-        ])
+    filas = [[
+        item['nombre'][:35],
+        str(item['cantidad']),
+        f"${item['precio']:.2f}",
+        f"-${item.get('descuento_total', 0):.2f}",
+        f"${item['subtotal']:.2f}"
+    ] for item in factura_data['items']]
+    table_data = [["Producto", "Cantidad", "P. Unitario", "Descuento", "Total"], *filas]
 
     table = Table(table_data, colWidths=[200, 60, 80, 80, 80])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), COLOR_PRINCIPAL),
-        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
-        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0,0), (-1,0), 9),
-        ('BOTTOMPADDING', (0,0), (-1,0), 8),
-        ('BACKGROUND', (0,1), (-1,-1), COLOR_SECUNDARIO),
-        ('GRID', (0,0), (-1,-1), 1, COLOR_PRINCIPAL)
-    ]))
+    table.setStyle(_FACTURA_TABLE_STYLE)
     elements.append(table)
 
     elements.append(Spacer(1, 24))
-    elements.append(Paragraph(f"Total a Pagar: ${total:.2f}", styles['Heading3']))
-    elements.append(Paragraph("¡Gracias por su preferencia!", styles['Normal']))
+    elements.append(Paragraph(f"Total a Pagar: ${total:.2f}", _STYLES['Heading3']))
+    elements.append(Paragraph("¡Gracias por su preferencia!", _STYLES['Normal']))
     doc.build(elements)
-    return pdf_output
+    return buffer.getvalue()
 
 def generar_reporte_pdf(ventas_data, fecha_reporte, total_dia, total_descuentos):
-    pdf_output = f"reporte_{fecha_reporte}.pdf"
-    doc = SimpleDocTemplate(pdf_output, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-
-    header_style = ParagraphStyle(
-        'Header',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=COLOR_PRINCIPAL,
-        alignment=TA_CENTER
-    )
-
-    elements.append(Paragraph(EMPRESA["nombre"], header_style))
-    elements.append(Paragraph(EMPRESA["direccion"], styles['Normal']))
-    elements.append(Paragraph(f"Tel: {EMPRESA['telefono']}", styles['Normal']))
-    elements.append(Spacer(1, 12))
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = [copy.copy(flowable) for flowable in _STATIC_HEADER]
 
-    elements.append(Paragraph(f"Reporte de Ventas del: {fecha_reporte}", styles['Heading3']))
+    elements.append(Paragraph(f"Reporte de Ventas del: {fecha_reporte}", _STYLES['Heading3']))
     elements.append(Spacer(1, 24))
 
-    elements.append(Paragraph(f"Total del Día: ${total_dia:.2f}", styles['Normal']))
-    elements.append(Paragraph(f"Total de Descuentos: ${total_descuentos:.2f}", styles['Normal']))
+    elements.append(Paragraph(f"Total del Día: ${total_dia:.2f}", _STYLES['Normal']))
+    elements.append(Paragraph(f"Total de Descuentos: ${total_descuentos:.2f}", _STYLES['Normal']))
     elements.append(Spacer(1, 18))
 
     # Actualizado para incluir la columna producto
-    table_data = [["N° Factura", "Fecha", "Total", "Descuento", "Productos"]]
-    for venta in ventas_data:
-        producto_texto = venta[4] if len(venta) >= 5 else ""
+    filas = [[
+        numero,  # N° Factura
+        fecha,  # Fecha
+        f"${total:.2f}",  # Total
+        f"${descuento:.2f}",  # Descuento
         # Trunca el texto de productos si es demasiado largo
-        if producto_texto and len(producto_texto) > 50:
-            producto_texto = producto_texto[:47] + "..."
-            
-        table_data.append([
-            venta[0],  # N° Factura
-            venta[1],  # Fecha
-            f"${venta[2]:.2f}",  # Total
-            f"${venta[3]:.2f}",  # Descuento
-            producto_texto  # Productos
-        ])
+        productos[:47] + "..." if productos and len(productos) > 50 else (productos or "")  # Productos
+    ] for numero, fecha, total, descuento, productos in ventas_data]
+    table_data = [["N° Factura", "Fecha", "Total", "Descuento", "Productos"], *filas]
 
     # Ajustar los anchos de columna para incluir productos
     table = Table(table_data, colWidths=[100, 80, 70, 70, 180])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), COLOR_PRINCIPAL),
-        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
-        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0,0), (-1,0), 9),
-        ('BACKGROUND', (0,1), (-1,-1), COLOR_SECUNDARIO),
-        ('GRID', (0,0), (-1,-1), 1, COLOR_PRINCIPAL)
-    ]))
+    table.setStyle(_REPORTE_TABLE_STYLE)
     elements.append(table)
 
     elements.append(Spacer(1, 20))
-    elements.append(Paragraph("Resumen General", styles['Heading3']))
+    elements.append(Paragraph("Resumen General", _STYLES['Heading3']))
     elements.append(Spacer(1, 15))
     resumen_data = [
         ["Total Ventas Brutas", f"${total_dia:.2f}"],
@@ -333,71 +465,86 @@ def generar_reporte_pdf(ventas_data, fecha_reporte, total_dia, total_descuentos)
         ["Total Neto", f"${total_dia - total_descuentos:.2f}"]
     ]
     resumen_table = Table(resumen_data, colWidths=[200, 100])
-    resumen_table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), COLOR_PRINCIPAL),
-        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('GRID', (0,0), (-1,-1), 1, COLOR_PRINCIPAL)
-    ]))
+    resumen_table.setStyle(_RESUMEN_TABLE_STYLE)
     elements.append(resumen_table)
     
     doc.build(elements)
-    return pdf_output
+    return buffer.getvalue()
+
+# Los PDFs se cachean por número de factura / contenido del reporte para no
+# repetir el maquetado de ReportLab en cada rerun; los argumentos con "_" no se hashean
+@st.cache_data(max_entries=20, show_spinner=False)
+def _pdf_factura(numero_factura, total, _factura_data):
+    return generar_pdf(_factura_data, numero_factura, total)
+
+@st.cache_data(max_entries=20, show_spinner=False)
+def _pdf_reporte(fecha_reporte, total_dia, total_descuentos, ventas_data):
+    return generar_reporte_pdf(ventas_data, fecha_reporte, total_dia, total_descuentos)
+
+def nueva_factura():
+    return {
+        'items': [],
+        'descuento': False,
+        'codigo_usado': None,
+        'monto_descuento': 0
+    }
+
+@st.fragment
+def _agregar_productos(productos):
+    # Fragmento: elegir producto o cantidad solo re-ejecuta este bloque;
+    # al agregar se relanza la app completa para actualizar la factura
+    st.subheader("Agregar Productos")
+    if productos:
+        producto_seleccionado = st.selectbox(
+            "Seleccionar producto:",
+            productos,
+            format_func=lambda p: f"{p['nombre']} - ${p['precio']:.2f}"
+        )
+        cantidad = st.number_input("Cantidad:", min_value=1, value=1)
+
+        if st.button("Agregar a la factura"):
+            producto_id = producto_seleccionado['id']
+            nombre = producto_seleccionado['nombre']
+            precio = producto_seleccionado['precio']
+            subtotal = cantidad * precio
+
+            nuevo_item = {
+                'producto_id': producto_id,
+                'nombre': nombre,
+                'precio': precio,
+                'cantidad': cantidad,
+                'subtotal': subtotal
+            }
+
+            st.session_state.factura['items'].append(nuevo_item)
+            st.toast("Producto agregado a la factura")
+            st.rerun()
 
 def pantalla_facturacion():
     st.title("📄 Sistema de Facturación")
 
     if 'factura' not in st.session_state:
-        st.session_state.factura = {
-            'items': [],
-            'descuento': False,
-            'codigo_usado': None,
-            'monto_descuento': 0
-        }
+        st.session_state.factura = nueva_factura()
 
     productos = ProductoManager.obtener_productos()
 
     col1, col2 = st.columns([3, 2])
 
     with col1:
-        st.subheader("Agregar Productos")
-        if productos:
-            producto_seleccionado = st.selectbox(
-                "Seleccionar producto:",
-                productos,
-                format_func=lambda p: f"{p[1]} - ${p[2]:.2f}"
-            )
-            cantidad = st.number_input("Cantidad:", min_value=1, value=1)
-
-            if st.button("Agregar a la factura"):
-                producto_id = producto_seleccionado[0]
-                nombre = producto_seleccionado[1]
-                precio = producto_seleccionado[2]
-                subtotal = cantidad * precio
-
-                nuevo_item = {
-                    'producto_id': producto_id,
-                    'nombre': nombre,
-                    'precio': precio,
-                    'cantidad': cantidad,
-                    'subtotal': subtotal
-                }
-
-                st.session_state.factura['items'].append(nuevo_item)
-                st.success("Producto agregado a la factura")
+        _agregar_productos(productos)
 
         st.subheader("Aplicar Descuento")
         codigo = st.text_input("Código de descuento:")
         
         if st.button("Validar Código"):
-            with database_connection() as conn:
-                cliente = conn.execute("SELECT * FROM clientes WHERE codigo_descuento = ?", (codigo,)).fetchone()
-                if cliente:
-                    st.session_state.factura['descuento'] = True
-                    st.session_state.factura['codigo_usado'] = codigo
-                    st.success("Código válido. Seleccione monto del descuento.")
-                else:
-                    st.error("Código inválido")
+            with read_conn() as conn:
+                codigo_valido = conn.execute(SQL_VALIDAR_CODIGO, (codigo,)).fetchone() is not None
+            if codigo_valido:
+                st.session_state.factura['descuento'] = True
+                st.session_state.factura['codigo_usado'] = codigo
+                st.success("Código válido. Seleccione monto del descuento.")
+            else:
+                st.error("Código inválido")
         
         if st.session_state.factura['descuento']:
             monto_seleccionado = st.selectbox(
@@ -408,47 +555,39 @@ def pantalla_facturacion():
             st.session_state.factura['monto_descuento'] = monto_seleccionado
             
             if st.button("Remover Descuento"):
-                st.session_state.factura = {
-                    'items': [{
-                        **item,
-                        'subtotal': item['precio'] * item['cantidad']
-                    } for item in st.session_state.factura['items']],
-                    'descuento': False,
-                    'codigo_usado': None,
-                    'monto_descuento': 0
-                }
+                for item in st.session_state.factura['items']:
+                    item['subtotal'] = item['precio'] * item['cantidad']
+                    item.pop('descuento_total', None)
+                st.session_state.factura.update(descuento=False, codigo_usado=None, monto_descuento=0)
                 st.rerun()
 
     with col2:
         st.subheader("Factura Actual")
         if st.session_state.factura['items']:
-            df = pd.DataFrame(st.session_state.factura['items'])
-            
-            # Cálculos de descuento
-            if st.session_state.factura['descuento']:
-                monto = st.session_state.factura['monto_descuento']
-                df['descuento_por_unidad'] = df['precio'].apply(lambda p: min(monto, p))
-                df['descuento_total'] = df['descuento_por_unidad'] * df['cantidad']
-                df['subtotal'] = (df['precio'] * df['cantidad']) - df['descuento_total']
-                df['subtotal'] = df['subtotal'].apply(lambda x: max(x, 0))
-
-                # Actualizar st.session_state.factura['items'] con el descuento
-                for i, item in enumerate(st.session_state.factura['items']):
-                    st.session_state.factura['items'][i]['descuento_total'] = df['descuento_total'].iloc[i]
-            else:
-                df['subtotal'] = df['precio'] * df['cantidad']
+            items = st.session_state.factura['items']
+            con_descuento = st.session_state.factura['descuento']
+            monto = st.session_state.factura['monto_descuento']
+
+            # Cálculos de descuento en una sola pasada sobre los items;
+            # item['subtotal'] se mantiene bruto, el neto solo se muestra
+            total = 0.0
+            filas = []
+            for item in items:
+                if con_descuento:
+                    item['descuento_total'] = min(monto, item['precio']) * item['cantidad']
+                    neto = max(item['subtotal'] - item['descuento_total'], 0.0)
+                else:
+                    neto = item['subtotal']
+                total += neto
+                filas.append({
+                    'Producto': item['nombre'],
+                    'Cantidad': item['cantidad'],
+                    'P. Unitario': item['precio'],
+                    'Total': neto
+                })
 
             # Mostrar tabla
-            st.dataframe(df[['nombre', 'cantidad', 'precio', 'subtotal']].rename(
-                columns={
-                    'nombre': 'Producto',
-                    'cantidad': 'Cantidad',
-                    'precio': 'P. Unitario',
-                    'subtotal': 'Total'
-                }
-            ), hide_index=True)
-
-            total = df['subtotal'].sum()
+            st.dataframe(filas, hide_index=True)
             
             # Validación final
             if total <= 0:
@@ -460,35 +599,29 @@ def pantalla_facturacion():
             if st.button("Finalizar Venta", type="primary") and total > 0:
                 success, factura_id = VentaManager.registrar_venta(st.session_state.factura)
                 if success:
-                    pdf_path = generar_pdf(st.session_state.factura, factura_id, total)
-                    with open(pdf_path, "rb") as f:
-                        st.download_button(
-                            "Descargar Factura",
-                            f,
-                            file_name=f"factura_{factura_id}.pdf",
-                            mime="application/pdf"
-                        )
-                    st.session_state.factura = {
-                        'items': [],
-                        'descuento': False,
-                        'codigo_usado': None,
-                        'monto_descuento': 0
-                    }
+                    # El PDF se genera al mostrar la descarga, no al registrar la venta
+                    st.session_state.factura_pendiente = (st.session_state.factura, factura_id, total)
+                    st.session_state.factura = nueva_factura()
                     st.success("Venta registrada exitosamente")
                 else:
                     st.error(factura_id)
 
             if st.button("Limpiar Factura"):
-                st.session_state.factura = {
-                    'items': [],
-                    'descuento': False,
-                    'codigo_usado': None,
-                    'monto_descuento': 0
-                }
+                st.session_state.factura = nueva_factura()
                 st.rerun()
         else:
             st.info("Agrega productos para comenzar una factura")
 
+        # Descarga de la última factura registrada
+        if 'factura_pendiente' in st.session_state and not st.session_state.factura['items']:
+            factura_data, factura_id, total_factura = st.session_state.factura_pendiente
+            st.download_button(
+                "Descargar Factura",
+                _pdf_factura(factura_id, total_factura, factura_data),
+                file_name=f"factura_{factura_id}.pdf",
+                mime="application/pdf"
+            )
+
 def pantalla_gestion_productos():
     st.title("🛠️ Gestión de Productos")
     opcion = st.sidebar.radio("Opciones", ["Agregar", "Editar", "Eliminar"])
@@ -515,20 +648,20 @@ def pantalla_gestion_productos():
             producto_seleccionado = st.selectbox(
                 "Seleccionar producto:",
                 productos,
-                format_func=lambda p: f"{p[1]} - ${p[2]:.2f}",
+                format_func=lambda p: f"{p['nombre']} - ${p['precio']:.2f}",
                 key="editar_producto"
             )
-            nuevo_nombre = st.text_input("Nuevo nombre*", value=producto_seleccionado[1])
+            nuevo_nombre = st.text_input("Nuevo nombre*", value=producto_seleccionado['nombre'])
             nuevo_precio = st.number_input(
                 "Nuevo precio*", 
                 min_value=0.01, 
-                value=float(producto_seleccionado[2]),
+                value=float(producto_seleccionado['precio']),
                 format="%.2f"
             )
             if st.button("Actualizar", key="actualizar_producto"):
                 if nuevo_nombre and nuevo_precio:
                     success, mensaje = ProductoManager.actualizar_producto(
-                        producto_seleccionado[0],
+                        producto_seleccionado['id'],
                         nuevo_nombre,
                         nuevo_precio
                     )
@@ -548,11 +681,11 @@ def pantalla_gestion_productos():
             producto_seleccionado = st.selectbox(
                 "Seleccionar producto a eliminar:",
                 productos,
-                format_func=lambda p: f"{p[1]} - ${p[2]:.2f}",
+                format_func=lambda p: f"{p['nombre']} - ${p['precio']:.2f}",
                 key="eliminar_producto"
             )
             if st.button("Confirmar Eliminación", type="primary"):
-                success, mensaje = ProductoManager.eliminar_producto(producto_seleccionado[0])
+                success, mensaje = ProductoManager.eliminar_producto(producto_seleccionado['id'])
                 if success:
                     st.success(mensaje)
                 else:
@@ -595,28 +728,28 @@ def pantalla_gestion_clientes():
             cliente_seleccionado = st.selectbox(
                 "Seleccionar cliente:",
                 clientes,
-                format_func=lambda c: f"{c[1]} - {c[2]} (Código: {c[5]})",
+                format_func=lambda c: f"{c['nombre']} - {c['cedula']} (Código: {c['codigo_descuento']})",
                 key="editar_cliente"
             )
             
             with st.form("editar_cliente_form"):
-                st.markdown(f"**Código de descuento actual:** `{cliente_seleccionado[5]}`")
-                nuevo_nombre = st.text_input("Nombre*", value=cliente_seleccionado[1])
-                nueva_cedula = st.text_input("Cédula*", value=cliente_seleccionado[2])
-                nuevo_telefono = st.text_input("Teléfono", value=cliente_seleccionado[3])
-                nueva_direccion = st.text_area("Dirección", value=cliente_seleccionado[4])
+                st.markdown(f"**Código de descuento actual:** `{cliente_seleccionado['codigo_descuento']}`")
+                nuevo_nombre = st.text_input("Nombre*", value=cliente_seleccionado['nombre'])
+                nueva_cedula = st.text_input("Cédula*", value=cliente_seleccionado['cedula'])
+                nuevo_telefono = st.text_input("Teléfono", value=cliente_seleccionado['telefono'])
+                nueva_direccion = st.text_area("Dirección", value=cliente_seleccionado['direccion'])
                 
                 if st.form_submit_button("Actualizar"):
                     if nuevo_nombre and nueva_cedula:
                         success, mensaje = ClienteManager.actualizar_cliente(
-                            cliente_seleccionado[0],
+                            cliente_seleccionado['id'],
                             nuevo_nombre,
                             nueva_cedula,
                             nuevo_telefono,
                             nueva_direccion
                         )
                         if success:
-                            st.success(f"{mensaje} - Código mantiene: `{cliente_seleccionado[5]}`")
+                            st.success(f"{mensaje} - Código mantiene: `{cliente_seleccionado['codigo_descuento']}`")
                         else:
                             st.error(mensaje)
                     else:
@@ -631,14 +764,14 @@ def pantalla_gestion_clientes():
             cliente_seleccionado = st.selectbox(
                 "Seleccionar cliente a eliminar:",
                 clientes,
-                format_func=lambda c: f"{c[1]} - Código: {c[5]}",
+                format_func=lambda c: f"{c['nombre']} - Código: {c['codigo_descuento']}",
                 key="eliminar_cliente"
             )
             
             if st.button("Confirmar Eliminación", type="primary"):
-                success, mensaje = ClienteManager.eliminar_cliente(cliente_seleccionado[0])
+                success, mensaje = ClienteManager.eliminar_cliente(cliente_seleccionado['id'])
                 if success:
-                    st.success(f"{mensaje} - Código eliminado: `{cliente_seleccionado[5]}`")
+                    st.success(f"{mensaje} - Código eliminado: `{cliente_seleccionado['codigo_descuento']}`")
                 else:
                     st.error(mensaje)
         else:
@@ -648,43 +781,48 @@ def pantalla_reportes():
     st.title("📊 Reportes de Ventas")
     fecha = st.date_input("Seleccionar fecha", datetime.date.today())
 
+    # Totales calculados por SQLite, sin traer las filas
+    total_dia, total_descuentos, num_ventas = VentaManager.resumen_por_fecha(fecha.isoformat())
+
+    # Métricas
+    if num_ventas:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Total del día", f"${total_dia:.2f}")
+        with col2:
+            st.metric("Total Descuentos", f"${total_descuentos:.2f}")
+        with col3:
+            st.metric("Total Neto", f"${total_dia - total_descuentos:.2f}")
+
     if st.button("Generar Reporte", key="generar_reporte"):
-        ventas = VentaManager.obtener_ventas_por_fecha(fecha.isoformat())
-
-        if ventas:
-            df = pd.DataFrame(ventas, columns=[
-                "N° Factura", "Fecha", "Total", "Descuento", "Productos"
-            ])
-
-            # Procesamiento de datos
-            total_dia = df['Total'].sum()
-            total_descuentos = df['Descuento'].sum()
-
-            # Métricas
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Total del día", f"${total_dia:.2f}")
-            with col2:
-                st.metric("Total Descuentos", f"${total_descuentos:.2f}")
-            with col3:
-                st.metric("Total Neto", f"${total_dia - total_descuentos:.2f}")
+        if num_ventas:
+            # Ventas por producto agregadas en SQL
+            por_producto = VentaManager.productos_por_fecha(fecha.isoformat())
+            if por_producto:
+                st.subheader("Ventas por Producto")
+                filas = [{'Producto': nombre, 'Unidades': unidades, 'Total': total}
+                         for nombre, unidades, total in por_producto]
+                st.bar_chart(filas, x='Producto', y='Total')
+                st.dataframe(filas, hide_index=True, use_container_width=True)
+
+            df = VentaManager.obtener_ventas_por_fecha(fecha.isoformat())
 
             # Tabla detallada
             st.subheader("Detalle Completo")
-            st.dataframe(df[['N° Factura', 'Fecha', 'Total', 'Descuento', 'Productos']]
-                          .rename(columns={'Total': 'Total Factura', 'Descuento': 'Descuento Factura'}),
+            st.dataframe(df.rename(columns={'Total': 'Total Factura', 'Descuento': 'Descuento Factura'}),
                           hide_index=True,
                           use_container_width=True)
 
             # Generar PDF
-            pdf_path = generar_reporte_pdf(ventas, fecha.strftime("%d-%m-%Y"), total_dia, total_descuentos)
-            with open(pdf_path, "rb") as f:
-                st.download_button(
-                    "Descargar Reporte Completo",
-                    f,
-                    file_name=f"reporte_{fecha.strftime('%d%m%y')}.pdf",
-                    mime="application/pdf"
-                )
+            # Las filas forman parte de la clave: renombrar o eliminar un producto cambia el PDF
+            ventas = tuple(df.itertuples(index=False, name=None))
+            pdf_bytes = _pdf_reporte(fecha.strftime("%d-%m-%Y"), total_dia, total_descuentos, ventas)
+            st.download_button(
+                "Descargar Reporte Completo",
+                pdf_bytes,
+                file_name=f"reporte_{fecha.strftime('%d%m%y')}.pdf",
+                mime="application/pdf"
+            )
         else:
             st.info("No hay ventas registradas para esta fecha")
 
@@ -697,6 +835,7 @@ def main():
             'About': "Sistema de Facturación v1.0 - Desarrollado por Carlos P."
         }
     )
+    _ensure_schema()
     st.sidebar.title("Menú Principal")
     menu = st.sidebar.radio(
         "Seleccionar módulo:",
@@ -714,5 +853,4 @@ def main():
         pantalla_reportes()
 
 if __name__ == "__main__":
-    init_db()
     main()
\ No newline at end of file